@@ -11,5 +11,8 @@
     src = lib.cleanSource ./.;
     version = lib.removeSuffix "\n" (builtins.readFile ./VERSION);
     name = "vulnix-${version}";
+    propagatedBuildInputs = old.propagatedBuildInputs ++ [
+      pkgs.python3Packages.ijson
+    ];
   }
 )
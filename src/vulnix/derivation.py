@@ -1,8 +1,10 @@
-from .utils import compare_versions
+from .utils import version_key
+from concurrent.futures import ProcessPoolExecutor
 import functools
 import json
 import logging
 import re
+import sys
 
 _log = logging.getLogger(__name__)
 
@@ -12,38 +14,136 @@ class SkipDrv(RuntimeError):
     pass
 
 
-# see parseDrvName built-in Nix function
-# https://nixos.org/nix/manual/#ssec-builtins
-R_VERSION = re.compile(r'^(\S+?)-([0-9]\S*)$')
-
-
+@functools.lru_cache(maxsize=65536)
 def split_name(fullname):
-    """Returns the pure package name and version of a derivation."""
+    """Returns the pure package name and version of a derivation.
+
+    The version starts after the first dash which is followed by a
+    digit, see the parseDrvName built-in Nix function
+    https://nixos.org/nix/manual/#ssec-builtins
+    """
     if fullname.endswith('.drv'):
         fullname = fullname[:-4]
-    m = R_VERSION.match(fullname)
-    if m:
-        return m.group(1), m.group(2)
+    i = fullname.find('-', 1)
+    while i != -1:
+        if '0' <= fullname[i + 1:i + 2] <= '9':
+            return sys.intern(fullname[:i]), fullname[i + 1:]
+        i = fullname.find('-', i + 1)
     return fullname, None
 
 
+# string, opening bracket, closing bracket, separator, anything else
+R_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|([\[(])|([\])])|(,)|(\S)',
+                     flags=re.DOTALL)
+R_ESCAPE = re.compile(r'\\(.)', flags=re.DOTALL)
+ESCAPES = {'n': '\n', 'r': '\r', 't': '\t'}
+OPENING = {']': '[', ')': '('}
+
+
+def unescape(m):
+    return ESCAPES.get(m.group(1), m.group(1))
+
+
+def parse_aterm(text):
+    """Returns the arguments of a `Derive(...)` expression.
+
+    .drv files are written in ATerm format which consists only of
+    (possibly nested) lists, tuples and strings separated by commas.
+    Anything else is rejected with ValueError.
+    """
+    if not text.startswith('Derive('):
+        raise ValueError('not a derivation', text[:40])
+    stack = []  # (opening bracket, items) of all unclosed lists/tuples
+    result = None
+    need_value = True  # after an opening bracket or a comma
+    for m in R_TOKEN.finditer(text, len('Derive')):
+        (string, opening, closing, comma, invalid) = m.groups()
+        if invalid or result is not None:
+            raise ValueError('unexpected character in derivation',
+                             text[m.start():m.start() + 40])
+        if string is not None or opening:
+            if not need_value:
+                raise ValueError('missing comma in derivation',
+                                 text[m.start():m.start() + 40])
+            if opening:
+                stack.append((opening, []))
+                continue
+            if '\\' in string:
+                string = R_ESCAPE.sub(unescape, string)
+            stack[-1][1].append(string)
+            need_value = False
+        elif closing:
+            (bracket, items) = stack.pop()
+            if bracket != OPENING[closing] or (need_value and items):
+                raise ValueError('unexpected bracket in derivation',
+                                 text[m.start():m.start() + 40])
+            value = tuple(items) if closing == ')' else items
+            if stack:
+                stack[-1][1].append(value)
+                need_value = False
+            else:
+                result = value
+        else:
+            if need_value:
+                raise ValueError('unexpected comma in derivation',
+                                 text[m.start():m.start() + 40])
+            need_value = True
+    if result is None:
+        raise ValueError('unbalanced brackets in derivation')
+    return result
+
+
+R_CVE = re.compile(r'CVE-\d{4}-\d+', flags=re.IGNORECASE | re.ASCII)
+
+
+@functools.lru_cache(maxsize=65536)
+def guess_patched_cves(patches):
+    """Returns CVE identifiers mentioned in a list of patch names.
+
+    Many derivations share the same patches, so results are cached.
+    """
+    return frozenset(m.group(0).upper() for m in R_CVE.finditer(patches))
+
+
 def load(path):
     with open(path) as f:
-        d_obj = eval(f.read(), {'__builtins__': {}, 'Derive': Derive}, {})
+        d_obj = Derive(*parse_aterm(f.read()))
     _log.debug('Loading drv %s', d_obj.name)
     d_obj.store_path = path
     return d_obj
 
 
+def load_or_skip(path):
+    """Like `load`, but returns None for derivations to be skipped."""
+    try:
+        return load(path)
+    except SkipDrv:
+        return None
+
+
+def load_all(paths, chunksize=64):
+    """Loads many .drv files in parallel, leaving out skipped ones.
+
+    Small batches are loaded in-process as starting worker processes
+    would take longer than parsing.
+    """
+    if len(paths) < 2 * chunksize:
+        return [d for d in map(load_or_skip, paths) if d is not None]
+    with ProcessPoolExecutor() as pool:
+        return [d for d in pool.map(load_or_skip, paths, chunksize=chunksize)
+                if d is not None]
+
+
 def destructure(env):
     """Decodes Nix 2.0 __structuredAttrs."""
     return json.loads(env['__json'])
 
 
-IGNORE_EXT = {
-    '.tar.gz', '.tar.bz2', '.tar.xz', 'tar.lz', '.zip', '.gem',
+# tuple so that it can be passed to str.endswith() directly
+IGNORE_EXT = (
+    '.tar.gz', '.tar.bz2', '.tar.xz', '.tar.lz', '.zip', '.gem',
     '.patch', '.patch.gz', '.patch.xz', '.diff',
-}
+)
 
 
 @functools.total_ordering
@@ -55,48 +155,50 @@ class Derive(object):
     def __init__(self, _output=None, _inputDrvs=None, _inputSrcs=None,
                  _system=None, builder=None, _args=None,
                  envVars={}, derivations=None, name=None, patches=None):
-        """Create a derivation from a .drv file.
+        """Create a derivation from the contents of a .drv file.
 
-        The derivation files are just accidentally Python-syntax, but
-        hey! :-)
+        Positional arguments are in the same order as in the ATerm
+        `Derive(...)` expression, see `parse_aterm`.
         """
         envVars = dict(envVars)
         self.name = name or envVars.get('name')
         if not self.name:
             self.name = destructure(envVars)['name']
-        for e in IGNORE_EXT:
-            if self.name.endswith(e):
-                raise SkipDrv()
+        if self.name.endswith(IGNORE_EXT):
+            raise SkipDrv()
 
         self.pname, self.version = split_name(self.name)
         if not self.version:
             raise SkipDrv()
         self.patches = patches or envVars.get('patches', '')
+        self._hash = hash(self.name)
 
     def __repr__(self):
         return '<Derive({})>'.format(repr(self.name))
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # string hashes differ between processes, see `load_all`
+        self._hash = hash(self.name)
+        self.pname = sys.intern(self.pname)
+
     def __eq__(self, other):
-        if type(self) != type(other):
-            return NotImplementedError()
+        if type(self) is not type(other):
+            return NotImplemented
         return self.name == other.name
 
     def __hash__(self):
-        return hash(self.name)
+        return self._hash
+
+    def sort_key(self):
+        """Orders by package name and then version."""
+        return (self.pname, version_key(self.version))
 
     def __lt__(self, other):
-        if self.pname < other.pname:
-            return True
-        if self.pname > other.pname:
-            return False
-        return compare_versions(self.version, other.version) == -1
+        return self.sort_key() < other.sort_key()
 
     def __gt__(self, other):
-        if self.pname > other.pname:
-            return True
-        if self.pname < other.pname:
-            return False
-        return compare_versions(self.version, other.version) == 1
+        return self.sort_key() > other.sort_key()
 
     def product_candidates(self):
         """Return product name variations in order of preference."""
@@ -108,20 +210,28 @@ class Derive(object):
                 yield c[i]
 
     def check(self, nvd):
-        affected_by = set()
-        patched_cves = self.applied_patches()
+        return self.select(lambda pname: nvd.affected(pname, self.version))
+
+    def select(self, affected):
+        """Returns unpatched vulns of the first affected product candidate.
+
+        `affected` is called with product candidates in order of
+        preference and returns the vulns matching this derivation's
+        version for the given product name (or something false).
+        """
+        patched_cves = None
         for pname in self.product_candidates():
-            for vuln in nvd.affected(pname, self.version):
-                if vuln.cve_id not in patched_cves:
-                    affected_by.add(vuln)
+            vulns = affected(pname)
+            if not vulns:
+                continue
+            if patched_cves is None:
+                patched_cves = self.applied_patches()
+            affected_by = {v for v in vulns if v.cve_id not in patched_cves}
             if affected_by:
                 # don't try further product candidates
                 return affected_by
-        return affected_by
-
-    R_CVE = re.compile(r'CVE-\d{4}-\d+', flags=re.IGNORECASE)
+        return set()
 
     def applied_patches(self):
         """Guess which CVEs are patched from patch names."""
-        return set(
-            m.group(0).upper() for m in self.R_CVE.finditer(self.patches))
+        return guess_patched_cves(self.patches)
@@ -62,11 +62,7 @@ def populate_store(gc_roots, paths, requisites=True):
 
 def run(nvd, store):
     """Returns a dict with affected derivations and vulnerabilities."""
-    affected = {}
-    for derivation in store.derivations:
-        vulns = derivation.check(nvd)
-        if vulns:
-            affected[derivation] = vulns
+    affected = nvd.affected_bulk(store.derivations)
     _log.debug("Unfiltered affected: %r", affected)
     return affected
 
@@ -1,4 +1,4 @@
-from .derivation import load, SkipDrv
+from .derivation import load_all
 from .utils import call
 import os.path as p
 import logging
@@ -11,6 +11,8 @@ class Store(object):
     def __init__(self, requisites=True):
         self.requisites = requisites
         self.derivations = set()
+        # store paths are immutable: each .drv needs to be parsed only once
+        self.seen = set()
 
     def add_gc_roots(self):
         """Add derivations found for all live GC roots.
@@ -18,8 +20,7 @@ class Store(object):
         Note that this usually includes old system versions.
         """
         _log.debug('loading all live derivations')
-        for d in call(['nix-store', '--gc', '--print-live']).splitlines():
-            self.update(d)
+        self.update(*call(['nix-store', '--gc', '--print-live']).splitlines())
 
     def add_path(self, path):
         """Add the closure of all derivations referenced by a store path."""
@@ -37,16 +38,13 @@ class Store(object):
                     'Cannot determine deriver. Is this really a path into the '
                     'nix store?', path)
         if self.requisites:
-            for candidate in call(['nix-store', '-qR', deriver]).splitlines():
-                self.update(candidate)
+            self.update(*call(['nix-store', '-qR', deriver]).splitlines())
         else:
             self.update(deriver)
 
-    def update(self, drv_path):
-        if not drv_path.endswith('.drv'):
-            return
-        try:
-            drv_obj = load(drv_path)
-        except SkipDrv:
-            return
-        self.derivations.add(drv_obj)
+    def update(self, *drv_paths):
+        """Add derivations from .drv files. Other paths are ignored."""
+        new = [d for d in dict.fromkeys(drv_paths)
+               if d.endswith('.drv') and d not in self.seen]
+        self.seen.update(new)
+        self.derivations.update(load_all(new))
@@ -1,20 +1,28 @@
 from BTrees import OOBTree
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
 from persistent import Persistent
 from .vulnerability import Vulnerability
 import glob
 import gzip
-import json
+import ijson
 import logging
 import os
 import os.path as p
 import requests
+import sys
 import transaction
 import ZODB
 import ZODB.FileStorage
 
 DEFAULT_MIRROR = 'https://nvd.nist.gov/feeds/json/cve/1.1/'
 DEFAULT_CACHE_DIR = '~/.cache/vulnix'
+# increment if the database layout changes
+SCHEMA = 4
+# Number of objects kept in the connection cache across commits. ZODB's
+# default (400) would unload almost everything which has been touched
+# by update() before vulnerabilities are scanned.
+CACHE_SIZE = 100000
 
 _log = logging.getLogger(__name__)
 
@@ -35,8 +43,10 @@ class NVD(object):
         """Keeps database connection open while in this context."""
         _log.debug('Opening database in %s', self.cache_dir)
         os.makedirs(self.cache_dir, exist_ok=True)
+        # cve_id -> previous version of vulns added since last reindex
+        self._updated = {}
         self._db = ZODB.DB(ZODB.FileStorage.FileStorage(
-            p.join(self.cache_dir, 'Data.fs')))
+            p.join(self.cache_dir, 'Data.fs')), cache_size=CACHE_SIZE)
         self._connection = self._db.open()
         self._root = self._connection.root()
         try:
@@ -48,6 +58,9 @@ class NVD(object):
             if 'archives' in self._root:
                 _log.warn('Pre-1.9.0 database found - rebuilding')
                 self.reinit()
+            elif self.meta.schema < SCHEMA:
+                _log.warn('Outdated database schema found - rebuilding')
+                self.reinit()
         except (TypeError, EOFError):
             _log.warn('Incompatible objects found in database - rebuilding DB')
             self.reinit()
@@ -63,6 +76,7 @@ class NVD(object):
             transaction.abort()
         self._connection.close()
         self._connection = None
+        self._db.close()
         self._db = None
 
     def reinit(self):
@@ -70,11 +84,12 @@ class NVD(object):
         self._root = None
         transaction.abort()
         self._connection.close()
+        self._db.close()
         self._db = None
         for f in glob.glob(p.join(self.cache_dir, "Data.fs*")):
             os.unlink(f)
         self._db = ZODB.DB(ZODB.FileStorage.FileStorage(
-            p.join(self.cache_dir, 'Data.fs')))
+            p.join(self.cache_dir, 'Data.fs')), cache_size=CACHE_SIZE)
         self._connection = self._db.open()
         self._root = self._connection.root()
         self._root['advisory'] = OOBTree.OOBTree()
@@ -102,32 +117,71 @@ class NVD(object):
         return self.available_archives
 
     def update(self):
-        """Download archives (if changed) and add CVEs to database."""
-        changed = []
-        for a in self.relevant_archives():
-            arch = Archive(a)
-            changed.append(arch.download(self.mirror, self.meta))
-            self.add(arch)
-        if any(changed):
+        """Download archives (if changed) and add CVEs to database.
+
+        Archives are fetched and parsed in parallel. The database is
+        only accessed from the calling thread as ZODB connections must
+        not be shared between threads.
+        """
+        archives = [Archive(a) for a in self.relevant_archives()]
+        if not archives:
+            return
+        changed = False
+        with ThreadPoolExecutor(max_workers=len(archives)) as pool:
+            futures = []
+            for arch in archives:
+                url = self.mirror + arch.download_uri
+                futures.append(pool.submit(
+                    arch.download, self.mirror, self.meta.headers_for(url),
+                    self.meta.sha256_for(url)))
+            for (arch, future) in zip(archives, futures):
+                if future.result():
+                    url = self.mirror + arch.download_uri
+                    self.meta.update_headers_for(url, arch.headers)
+                    self.meta.update_sha256_for(url, arch.sha256)
+                    changed = True
+                self.add(arch)
+        if changed:
             self.meta.last_update = datetime.now()
             self.reindex()
 
     def add(self, archive):
+        """Stores vulns from `archive` and remembers them for `reindex`."""
         advisories = self._root['advisory']
         for (cve_id, adv) in archive.items():
+            self._updated.setdefault(cve_id, advisories.get(cve_id))
             advisories[cve_id] = adv
 
-    def reindex(self):
-        """Regenerate product index."""
-        _log.info('Reindexing database')
-        del self._root['by_product']
-        bp = OOBTree.OOBTree()
-        for vuln in self._root['advisory'].values():
-            if vuln.nodes:
-                for prod in (n.product for n in vuln.nodes):
-                    bp.setdefault(prod, [])
-                    bp[prod].append(vuln)
-        self._root['by_product'] = bp
+    def reindex(self, force=False):
+        """Update product index with vulns added since the last call.
+
+        The whole index is regenerated if `force` is true.
+        """
+        if force:
+            _log.info('Reindexing database')
+            del self._root['by_product']
+            self._root['by_product'] = OOBTree.OOBTree()
+            updated = {cve_id: None for cve_id in self._root['advisory']}
+        else:
+            _log.info('Reindexing %s vulnerabilities', len(self._updated))
+            updated = self._updated
+        bp = self._root['by_product']
+        advisories = self._root['advisory']
+        for (cve_id, old) in updated.items():
+            if old is not None:
+                for prod in old.products:
+                    entries = bp.get(prod)
+                    if entries is not None and cve_id in entries:
+                        del entries[cve_id]
+                        if not entries:
+                            del bp[prod]
+            vuln = advisories[cve_id]
+            for prod in vuln.products:
+                prod = sys.intern(prod)
+                if prod not in bp:
+                    bp[prod] = OOBTree.OOBTree()
+                bp[prod][cve_id] = vuln
+        self._updated = {}
         transaction.commit()
 
     def by_id(self, cve_id):
@@ -135,9 +189,9 @@ class NVD(object):
         return self._root['advisory'][cve_id]
 
     def by_product(self, product):
-        """Returns list of matching vulns or empty list."""
+        """Returns sequence of matching vulns or empty list."""
         try:
-            return self._root['by_product'][product]
+            return self._root['by_product'][product].values()
         except KeyError:
             return []
 
@@ -149,6 +203,36 @@ class NVD(object):
                 res.add(vuln)
         return res
 
+    def affected_bulk(self, derivations):
+        """Returns dict of derivations and their vulnerabilities.
+
+        The result is the same as calling `Derive.check` for each of
+        `derivations`, but each product is looked up only once and each
+        distinct product/version pair is matched only once.
+        """
+        candidates = {}
+        for d in derivations:
+            for pname in d.product_candidates():
+                candidates.setdefault(pname, {}).setdefault(
+                    d.version, []).append(d)
+        matches = {}
+        for pname in sorted(candidates):
+            vulns = self.by_product(pname)
+            if not vulns:
+                continue
+            for (version, derivs) in candidates[pname].items():
+                hits = {v for v in vulns if v.match(pname, version)}
+                if hits:
+                    for d in derivs:
+                        matches[d, pname] = hits
+        res = {}
+        # most derivations match nothing at all and need no selection
+        for d in {d for (d, _) in matches}:
+            affected_by = d.select(lambda pname: matches.get((d, pname)))
+            if affected_by:
+                res[d] = affected_by
+        return res
+
 
 class Archive:
 
@@ -161,33 +245,78 @@ class Archive:
         """
         self.name = name
         self.download_uri = 'nvdcve-1.1-{}.json.gz'.format(name)
+        self.meta_uri = 'nvdcve-1.1-{}.meta'.format(name)
         self.advisories = {}
+        self.headers = {}
+        self.sha256 = None
 
-    def download(self, mirror, meta):
+    def fetch_sha256(self, mirror, session=requests):
+        """Returns checksum from the feed's .meta file or None.
+
+        The .meta file is tiny compared to the feed itself. Mirrors are
+        not required to provide it.
+        """
+        r = session.get(mirror + self.meta_uri)
+        if r.status_code != 200:
+            _log.debug('No meta data for JSON feed "%s" (%s)', self.name,
+                       r.reason)
+            return None
+        for line in r.text.splitlines():
+            (key, _, value) = line.partition(':')
+            if key == 'sha256':
+                return value.strip()
+        return None
+
+    def download(self, mirror, headers, sha256=None, session=None):
         """Fetches compressed JSON data from NIST.
 
-        Nothing is done if we have already seen the same version of
-        the feed before.
+        Nothing is done if the feed's checksum matches `sha256`, i.e.
+        the checksum seen when the feed was loaded last time. `headers`
+        are sent along with the request. They should make it conditional
+        as well. Response headers and the current checksum are kept in
+        `self.headers` and `self.sha256`.
+
+        Requests are issued via `session`. If none is given, a new
+        `requests.Session` is used for this download only so that the
+        .meta and feed requests share a keep-alive connection. Sessions
+        are not documented to be thread-safe and must not be shared
+        between concurrent downloads.
 
         Returns True if anything has been loaded successfully.
         """
+        if session is None:
+            with requests.Session() as session:
+                return self.download(mirror, headers, sha256, session)
+        self.sha256 = self.fetch_sha256(mirror, session)
+        if sha256 and self.sha256 == sha256:
+            _log.debug('Skipping JSON feed "%s" (checksum unchanged)',
+                       self.name)
+            return False
         url = mirror + self.download_uri
         _log.info('Loading %s', url)
-        r = requests.get(url, headers=meta.headers_for(url))
-        r.raise_for_status()
-        if r.status_code == 200:
-            _log.debug('Loading JSON feed "%s"', self.name)
-            self.parse(gzip.decompress(r.content))
-            meta.update_headers_for(url, r.headers)
-            return True
-        else:
-            _log.debug('Skipping JSON feed "%s" (%s)', self.name, r.reason)
-            return False
+        with session.get(url, headers=headers, stream=True) as r:
+            r.raise_for_status()
+            if r.status_code == 200:
+                _log.debug('Loading JSON feed "%s"', self.name)
+                # undo transfer encodings (if any) but not the .gz itself
+                r.raw.decode_content = True
+                with gzip.GzipFile(fileobj=r.raw) as f:
+                    self.parse(f)
+                self.headers = r.headers
+                return True
+            else:
+                _log.debug('Skipping JSON feed "%s" (%s)', self.name,
+                           r.reason)
+                return False
 
     def parse(self, nvd_json):
+        """Adds vulnerabilities from a file-like object with JSON data.
+
+        The feed is parsed incrementally so that only a single CVE item
+        needs to be held in memory at any time.
+        """
         added = 0
-        raw = json.loads(nvd_json)
-        for item in raw['CVE_Items']:
+        for item in ijson.items(nvd_json, 'CVE_Items.item', use_float=True):
             try:
                 vuln = Vulnerability.parse(item)
                 self.advisories[vuln.cve_id] = vuln
@@ -206,6 +335,13 @@ class Meta(Persistent):
     pack_counter = 0
     last_update = datetime(1970, 1, 1)
     etag = None
+    last_modified = None
+    sha256 = None
+    # databases created before schema versioning was introduced
+    schema = 1
+
+    def __init__(self):
+        self.schema = SCHEMA
 
     def should_pack(self):
         self.pack_counter += 1
@@ -216,9 +352,12 @@ class Meta(Persistent):
 
     def headers_for(self, url):
         """Returns dict of additional request headers."""
+        headers = {}
         if self.etag and url in self.etag:
-            return {'If-None-Match': self.etag[url]}
-        return {}
+            headers['If-None-Match'] = self.etag[url]
+        if self.last_modified and url in self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified[url]
+        return headers
 
     def update_headers_for(self, url, resp_headers):
         """Updates self from HTTP response headers."""
@@ -226,3 +365,20 @@ class Meta(Persistent):
             if self.etag is None:
                 self.etag = OOBTree.OOBTree()
             self.etag[url] = resp_headers['ETag']
+        if 'Last-Modified' in resp_headers:
+            if self.last_modified is None:
+                self.last_modified = OOBTree.OOBTree()
+            self.last_modified[url] = resp_headers['Last-Modified']
+
+    def sha256_for(self, url):
+        """Returns checksum of the last loaded version of a feed."""
+        if self.sha256:
+            return self.sha256.get(url)
+        return None
+
+    def update_sha256_for(self, url, sha256):
+        """Remembers checksum of a successfully loaded feed."""
+        if sha256:
+            if self.sha256 is None:
+                self.sha256 = OOBTree.OOBTree()
+            self.sha256[url] = sha256
@@ -30,6 +30,13 @@ def whitelist():
 
 class RequestHandler(http.server.SimpleHTTPRequestHandler):
 
+    # allow keep-alive connections
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
     def do_GET(self):
         """Serve a GET request from the fixtures directory"""
         fn = p.join(p.dirname(__file__), 'fixtures', self.path[1:])
@@ -40,24 +47,31 @@ class RequestHandler(http.server.SimpleHTTPRequestHandler):
                 content = f.read()
         except OSError:
             self.send_error(HTTPStatus.NOT_FOUND)
-        except IOError:
-            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR)
+            return
         self.send_response(HTTPStatus.OK)
         self.send_header('Content-Type', self.guess_type(fn))
         self.send_header('Content-Length', stat.st_size)
         self.send_header('ETag', hashlib.sha1(content).hexdigest())
+        self.send_header('Last-Modified',
+                         self.date_time_string(stat.st_mtime))
         self.end_headers()
         self.wfile.write(content)
 
 
 @pytest.yield_fixture
-def http_server():
-    httpd = http.server.HTTPServer(("127.0.0.1", 0), RequestHandler)
-    port = httpd.socket.getsockname()[1]
-    mirror_url = 'http://127.0.0.1:{}/'.format(port)
+def httpd():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+    httpd.daemon_threads = True
+    httpd.connections = 0
     t = threading.Thread(target=httpd.serve_forever, daemon=True)
     t.start()
-    yield mirror_url
+    yield httpd
+
+
+@pytest.fixture
+def http_server(httpd):
+    port = httpd.socket.getsockname()[1]
+    return 'http://127.0.0.1:{}/'.format(port)
 
 
 @pytest.yield_fixture
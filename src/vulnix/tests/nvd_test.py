@@ -1,3 +1,5 @@
+from vulnix.derivation import Derive, load as load_drv
+from vulnix.nvd import NVD, Archive, SCHEMA
 from vulnix.vulnerability import Vulnerability, Node
 import json
 import pkg_resources
@@ -16,6 +18,88 @@ def test_update(nvd):
     assert cve == nvd.by_product('transmission')[0]
 
 
+def test_update_records_headers(nvd):
+    nvd.update()
+    url = nvd.mirror + 'nvdcve-1.1-modified.json.gz'
+    assert nvd.meta.headers_for(url) == {
+        'If-None-Match': nvd.meta.etag[url],
+        'If-Modified-Since': nvd.meta.last_modified[url],
+    }
+    assert nvd.meta.sha256_for(url) == (
+        'C35E228C41B618B713AE21B09C6B11D19EF55F16B6366303A765757E9542F653')
+
+
+def test_update_reuses_connection(nvd, httpd):
+    nvd.update()
+    # .meta and feed requests are served over the same connection
+    assert httpd.connections == 1
+
+
+def test_skip_download_if_checksum_unchanged(http_server):
+    arch = Archive('modified')
+    assert not arch.download(http_server, {}, (
+        'C35E228C41B618B713AE21B09C6B11D19EF55F16B6366303A765757E9542F653'))
+    assert not arch.advisories
+    assert arch.download(http_server, {}, 'OUTDATED')
+    assert len(arch.advisories) == 835
+
+
+def test_download_without_meta_file(http_server):
+    arch = Archive('modified')
+    arch.meta_uri = 'nonexistent.meta'
+    assert arch.download(http_server, {}, 'OUTDATED')
+    assert arch.sha256 is None
+
+
+def test_rebuild_outdated_schema(tmpdir, http_server):
+    nvd = NVD(mirror=http_server, cache_dir=str(tmpdir))
+    nvd.available_archives = ['modified']
+    with nvd:
+        nvd.update()
+        nvd.meta.schema = 1
+    with nvd:
+        assert nvd.meta.schema == SCHEMA
+        assert len(nvd._root['advisory']) == 0
+        nvd.update()
+    with nvd:
+        assert nvd.by_product('transmission')[0].nodes == \
+            Vulnerability.parse(load('CVE-2010-0748')).nodes
+
+
+def test_reindex_updated_vulns_only(nvd):
+    nvd.update()
+    arch = Archive('modified')
+    arch.advisories['CVE-2010-0748'] = Vulnerability(
+        'CVE-2010-0748', [Node('vendor', 'product', '1.0')])
+    nvd.add(arch)
+    nvd.reindex()
+    assert [v.cve_id for v in nvd.by_product('transmission')] == [
+        'CVE-2010-0749']
+    assert list(nvd.by_product('product')) == [arch.advisories[
+        'CVE-2010-0748']]
+    index = {prod: list(vulns.keys())
+             for (prod, vulns) in nvd._root['by_product'].items()}
+    nvd.reindex(force=True)
+    assert index == {prod: list(vulns.keys())
+                     for (prod, vulns) in nvd._root['by_product'].items()}
+
+
+def test_affected_bulk(nvd):
+    nvd.update()
+    derivs = [
+        Derive(name='transmission-1.91'),
+        Derive(name='transmission-1.92',
+               patches='CVE-2010-0748.patch CVE-2010-0749.patch'),
+        load_drv(pkg_resources.resource_filename(
+            'vulnix', 'tests/fixtures/unzip-6.0.drv')),
+    ]
+    assert nvd.affected_bulk(derivs) == {
+        derivs[0]: derivs[0].check(nvd),
+    }
+    assert {v.cve_id for v in nvd.affected_bulk(derivs)[derivs[0]]} == {
+        'CVE-2010-0748', 'CVE-2010-0749'}
+
+
 def test_parse_vuln():
     v = Vulnerability.parse(load('CVE-2019-10160'))
     assert v.cve_id == 'CVE-2019-10160'
@@ -1,5 +1,6 @@
 from vulnix.vulnerability import Vulnerability
-from vulnix.derivation import Derive, split_name, load, SkipDrv
+from vulnix.derivation import Derive, split_name, load, load_all, \
+    parse_aterm, SkipDrv
 import os
 import pkg_resources
 import pytest
@@ -26,17 +27,52 @@ def test_should_not_load_arbitrary_code():
 Derive(envVars={{'name': str((lambda: open('{}', 'w').write('shellcode'))())}})
 """.format(b.name), file=f)
             f.flush()
-            with pytest.raises(NameError):
+            with pytest.raises(ValueError):
                 load(f.name)
             assert os.path.getsize(b.name) == 0
 
 
+def test_load_all():
+    paths = [pkg_resources.resource_filename(
+        'vulnix', 'tests/fixtures/{}.drv'.format(f))
+        for f in ['cpio-2.12', 'unzip-6.0', 'transmission-1.91']]
+    derivs = load_all(paths, chunksize=1)
+    assert derivs == [load(p) for p in paths]
+    assert derivs[0] in {load(paths[0])}
+    assert [d.store_path for d in derivs] == paths
+
+
+def test_parse_aterm():
+    assert parse_aterm(
+        r'Derive([("out","/nix/store/x","","")],[],["a\"b\\c\n"],'
+        r'"x86_64-linux","/bin/sh",[],[("name","x-1")])') == (
+            [('out', '/nix/store/x', '', '')], [], ['a"b\\c\n'],
+            'x86_64-linux', '/bin/sh', [], [('name', 'x-1')])
+    with pytest.raises(ValueError):
+        parse_aterm('Derive([("out","")]')
+    with pytest.raises(ValueError):
+        parse_aterm('Derive([])])')
+    with pytest.raises(ValueError):
+        parse_aterm('Derive([("a","b"]],["x","y"])')
+    with pytest.raises(ValueError):
+        parse_aterm('Derive([("a","b")],["x" "y"])')
+    with pytest.raises(ValueError):
+        parse_aterm('Derive([("a","b")],["x",])')
+    with pytest.raises(ValueError):
+        parse_aterm('Derive([("a","b")],,["x"])')
+    assert parse_aterm('Derive([],[()])') == ([], [()])
+
+
 def test_split_name():
     assert split_name('network-2.6.3.2-r1.cabal') == (
         'network', '2.6.3.2-r1.cabal')
     assert split_name('python2.7-pytest-runner-2.6.2.drv') == (
         'python2.7-pytest-runner', '2.6.2')
     assert split_name('hook.drv') == ('hook', None)
+    assert split_name('perl-Email-Address-1.912') == (
+        'perl-Email-Address', '1.912')
+    assert split_name('-1.0') == ('-1.0', None)
+    assert split_name('trailing-') == ('trailing-', None)
 
 
 def test_split_nameversion():
@@ -50,6 +86,13 @@ def test_split_name_noversion():
         Derive(envVars={'name': 'hook'})
 
 
+def test_skip_sources_and_patches():
+    with pytest.raises(SkipDrv):
+        Derive(name='cpio-2.12.tar.bz2')
+    with pytest.raises(SkipDrv):
+        Derive(name='CVE-2015-1197-cpio-2.12.patch')
+
+
 def test_guess_cves_from_direct_patches_bzip2():
     deriv = drv('bzip2-1.0.6.0.1')
     assert {'CVE-2016-3189'} == deriv.applied_patches()
@@ -99,6 +142,7 @@ def test_ignore_patched_cves_during_check(nvd):
 def test_ordering():
     assert Derive(name='python-2.7.14') == Derive(name='python-2.7.14')
     assert Derive(name='python-2.7.14') != Derive(name='python-2.7.13')
+    assert Derive(name='python-2.7.14') != 'python-2.7.14'
     assert Derive(name='coreutils-8.29') < Derive(name='patch-2.7.6')
     assert not Derive(name='python-2.7.5') < Derive(name='patch-2.7.6')
     assert Derive(name='python-2.7.6') > Derive(name='patch-2.7.6')
@@ -1,4 +1,5 @@
-from vulnix.utils import compare_versions, split_components, haskeys
+from vulnix.utils import compare_versions, split_components, haskeys, \
+    version_key
 
 
 def test_compare_versions():
@@ -24,6 +25,13 @@ def test_split_components():
     assert ['5', '1', 'a', 'lts'] == list(split_components('5.1a-lts'))
 
 
+def test_version_key():
+    assert version_key('1.0') == version_key('1-0') == version_key('1.00')
+    versions = ['2.3', '2.3pre1', '2.3.1', '2.3c', '2.3pre12', '2.10']
+    assert sorted(versions, key=version_key) == [
+        '2.3pre1', '2.3pre12', '2.3', '2.3c', '2.3.1', '2.10']
+
+
 def test_haskeys():
     assert not haskeys({}, 'foo')
     assert haskeys({'foo': 1}, 'foo')
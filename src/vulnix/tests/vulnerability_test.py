@@ -31,6 +31,10 @@ def test_parse_single_matches():
     ]
     assert v.match('openssl', '1.0.1a')
     assert not v.match('openssl', '1.0.1d')
+    assert v.products == {
+        'jboss_enterprise_application_platform', 'jboss_enterprise_web_server',
+        'jboss_web_server', 'python', 'openssl'}
+    assert not v.match('libressl', '1.0.1a')
 
 
 def test_ignore_AND_operator():
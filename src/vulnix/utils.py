@@ -1,4 +1,4 @@
-import itertools
+import functools
 import logging
 import subprocess
 import sys
@@ -37,29 +37,25 @@ class Timer:
         return False  # re-raise
 
 
-def components_lt(left, right):
-    """Port from nix/src/libexpr/names.cc"""
-    try:
-        lnum = int(left)
-    except (ValueError):
-        lnum = None
+def component_key(c):
+    """Sort key for a single version component.
+
+    Port from nix/src/libexpr/names.cc: numbers compare numerically and
+    are newer than anything else, "pre" is older than anything else
+    (including a missing component, represented as empty string), all
+    other strings compare lexicographically.
+    """
     try:
-        rnum = int(right)
-    except (ValueError):
-        rnum = None
-    if lnum is not None and rnum is not None:
-        return lnum < rnum
-    if left == '' and rnum is not None:
-        return True
-    if left == 'pre' and right != 'pre':
-        return True
-    if right == 'pre':
-        return False
-    if rnum is not None:
-        return True
-    if lnum is not None:
-        return False
-    return left < right
+        return (2, int(c), '')
+    except ValueError:
+        pass
+    if c == 'pre':
+        return (0, 0, '')
+    return (1, 0, c)
+
+
+# key of a missing component, which Nix treats like an empty string
+END_KEY = component_key('')
 
 
 def category(char):
@@ -85,6 +81,19 @@ def split_components(v):
         start = i
 
 
+@functools.lru_cache(maxsize=65536)
+def version_key(v):
+    """Returns a sort key for version `v`.
+
+    Keys compare like versions do in `compare_versions`, but within C
+    tuple comparisons. Version strings recur a lot both in NVD data and
+    in derivations, so results are cached.
+    """
+    # Components are never empty, so END_KEY never compares equal to a
+    # real component and marks where the shorter version is padded.
+    return tuple(component_key(c) for c in split_components(v)) + (END_KEY,)
+
+
 def compare_versions(left, right):
     """Compare two versions with the same logic as `nix-env -u`.
 
@@ -96,15 +105,9 @@ def compare_versions(left, right):
     """
     if left == right:
         return 0
-    for (lc, rc) in itertools.zip_longest(
-            split_components(left), split_components(right), fillvalue=''):
-        if lc == rc:
-            continue
-        if components_lt(lc, rc):
-            return -1
-        if components_lt(rc, lc):
-            return 1
-    return 0
+    lkey = version_key(left)
+    rkey = version_key(right)
+    return (lkey > rkey) - (lkey < rkey)
 
 
 def haskeys(d, *keys):
@@ -2,6 +2,7 @@ from persistent import Persistent
 from .utils import compare_versions, haskeys
 import functools
 import re
+import sys
 
 
 @functools.total_ordering
@@ -15,12 +16,14 @@ class Vulnerability(Persistent):
 
     cve_id = None
     nodes = None
+    products = frozenset()
     cvssv3 = 0.0
     cvssv2 = 0.0
 
     def __init__(self, cve_id, nodes=None, cvssv3=0.0, cvssv2=0.0):
         self.cve_id = cve_id
         self.nodes = nodes or []
+        self.products = frozenset(n.product for n in self.nodes)
         self.cvssv3 = float(cvssv3)
         self.cvssv2 = float(cvssv2)
 
@@ -48,6 +51,7 @@ class Vulnerability(Persistent):
         res = cls(item['cve']['CVE_data_meta']['ID'])
         if 'configurations' in item:
             res.nodes = Node.parse(item['configurations'].get('nodes', []))
+            res.products = frozenset(n.product for n in res.nodes)
         if haskeys(item, 'impact', 'baseMetricV3', 'cvssV3', 'baseScore'):
             res.cvssv3 = float(
                 item['impact']['baseMetricV3']['cvssV3']['baseScore'])
@@ -58,6 +62,8 @@ class Vulnerability(Persistent):
 
     def match(self, pname, pvers):
         """Returns True if package version is covered by any node."""
+        if pname not in self.products:
+            return False
         for n in self.nodes:
             if not n.product == pname:
                 continue
@@ -81,9 +87,7 @@ class Node:
       This may change in a future version.
     """
 
-    vendor = None
-    product = None
-    version = None
+    __slots__ = ('vendor', 'product', 'version')
 
     def __init__(self, vendor, product, version=None):
         self.vendor = vendor
@@ -111,7 +115,7 @@ class Node:
                 cpe23Uri.split(':', 7)
             if cpe != 'cpe' or cpevers != '2.3' or typ != 'a':
                 continue
-            e = cls(vendor, product)
+            e = cls(sys.intern(vendor), sys.intern(product))
             if vers and vers != '*' and vers != '-':
                 if rev and rev != '*' and rev != '-':
                     vers = vers + '-' + rev
@@ -129,14 +133,6 @@ class Node:
             if e.version:
                 # no point adding an expr without any version match
                 nodes.append(e)
-        # dedup strings
-        if len(nodes) > 1:
-            first = nodes[0]
-            for n in nodes[1:]:
-                if n.vendor == first.vendor:
-                    n.vendor = first.vendor
-                if n.product == first.product:
-                    n.product = first.product
         return nodes
 
     def __eq__(self, other):